@@ -2,25 +2,290 @@
 Utility functions for calling APIs.
 """
 
+import os
+import re
 import sys
+import time
+import random
+import hashlib
+import functools
+import tempfile
+import threading
+import orjson
 import requests
 from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import RequestException
 
 API_MAX_RETRIES = 5
 API_BACKOFF_FACTOR = 0.3
+API_BACKOFF_MAX = 30
+API_MAX_CONNECTIONS = 8
+
+# api.weather.gov asks clients to identify themselves, and may reject requests without a User-Agent
+API_USER_AGENT = '4444cast (https://github.com/jlyons210/4444cast)'
+
+
+class JitteredRetry(Retry):
+    """
+    Retry policy with "full jitter" backoff. Sleeps a random time between zero and the usual
+    exponential backoff, so clients that failed at the same moment don't all retry in lockstep.
+    """
+
+    def get_backoff_time(self) -> float:
+        """
+        Gets the time to sleep before the next retry.
+
+        Returns:
+            float: The backoff time, in seconds
+        """
+
+        backoff = min(API_BACKOFF_MAX, super().get_backoff_time())
+        return random.uniform(0, backoff)
+
+
+def _create_session() -> requests.Session:
+    """
+    Creates the HTTP session shared by all API calls. Reusing one session keeps connections alive
+    between calls, so back-to-back requests to the same host skip the TCP and TLS handshakes. Use
+    _get_session() rather than calling this directly.
+
+    Returns:
+        requests.Session: The shared session
+    """
+
+    session = requests.Session()
+    session.headers['User-Agent'] = API_USER_AGENT
+
+    retry = JitteredRetry(
+        total                       = API_MAX_RETRIES,
+        backoff_factor              = API_BACKOFF_FACTOR,
+        respect_retry_after_header  = True,
+        allowed_methods             = frozenset(['GET']),
+        # Return the last response once retries run out, so raise_for_status() reports the
+        # actual HTTP error rather than a generic "max retries exceeded"
+        raise_on_status             = False,
+        status_forcelist            = [
+            429,  # Too Many Requests
+            500,  # Internal Server Error
+            502,  # Bad Gateway
+            503,  # Service Unavailable
+            504,  # Gateway Timeout
+        ]
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections    = 4,
+        pool_maxsize        = API_MAX_CONNECTIONS,
+        max_retries         = retry,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+_SESSION: requests.Session = None
+_SESSION_LOCK = threading.Lock()
+
+# Per-URL locks for call_with_etag_cache, so concurrent calls for the same URL make one request
+_URL_LOCKS: dict[str, threading.Lock] = {}
+_URL_LOCKS_LOCK = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """
+    Gets the shared HTTP session, creating it on first use. Runs that never call an API, e.g.
+    --help or usage errors, skip building it.
+
+    Returns:
+        requests.Session: The shared session
+    """
+
+    global _SESSION
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = _create_session()
+
+    return _SESSION
+
+
+def _get_max_age(
+        headers         : dict[str, str],
+        default_max_age : int,
+    ) -> int:
+    """
+    Gets how long a response may be reused without asking the API again, from its Cache-Control
+    header.
+
+    Args:
+        headers (dict): The response headers
+        default_max_age (int): The max age to use if the response doesn't specify one
+
+    Returns:
+        int: The max age, in seconds
+    """
+
+    cache_control = headers.get('Cache-Control', '').lower()
+
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0
+
+    match = re.search(r'max-age=(\d+)', cache_control)
+    return int(match.group(1)) if match else default_max_age
+
+
+def _is_no_store(headers: dict[str, str]) -> bool:
+    """
+    Checks whether a response must not be stored, from its Cache-Control header. Unlike no-cache,
+    which allows storing a response as long as it is revalidated before reuse, no-store forbids
+    keeping it at all.
+
+    Args:
+        headers (dict): The response headers
+
+    Returns:
+        bool: True if the response must not be stored
+    """
+
+    return 'no-store' in headers.get('Cache-Control', '').lower()
+
 
 class ApiTools:
     """
     Utility functions for calling APIs.
     """
 
+    @staticmethod
+    def call_if_modified(
+            url     : str,
+            etag    : str = None,
+        ) -> tuple[dict, dict[str, str]]:
+        """
+        Utility function for calling an API with retries, as a conditional request. When an ETag
+        is given and the resource is unchanged, the API replies 304 Not Modified with no body.
+
+        Args:
+            url (str): The URL to call
+            etag (str): The ETag of the caller's copy of the response, if any
+
+        Returns:
+            tuple: The JSON response from the API, or None if not modified, and the response headers
+        """
+
+        headers = { 'If-None-Match': etag } if etag else {}
+        response = ApiTools._get(url, headers)
+
+        if response.status_code == 304 and etag:
+            return None, response.headers
+
+        return orjson.loads(response.content), response.headers
+
+
+    @staticmethod
+    def call_with_etag_cache(
+            url             : str,
+            cache_dir       : str,
+            default_max_age : int = 0,
+        ) -> tuple[dict, float]:
+        """
+        Utility function for calling an API with retries, reusing the last response while it is
+        fresh or unchanged. The response, its ETag, and its expiry are cached on disk. Until the
+        expiry given by Cache-Control max-age, the cached response is used without calling the API.
+        After that the next call sends a conditional request, and a 304 Not Modified reply reuses
+        the cached response.
+
+        Concurrent calls for the same URL, e.g. for zip codes in the same NWS grid, are serialized,
+        so only the first one calls the API and the rest reuse its freshly cached response.
+
+        Args:
+            url (str): The URL to call
+            cache_dir (str): The directory to cache responses in
+            default_max_age (int): How long to reuse a response if it doesn't set a max-age
+
+        Returns:
+            tuple: The JSON response from the API, and the time it stops being fresh
+        """
+
+        with _URL_LOCKS_LOCK:
+            url_lock = _URL_LOCKS.setdefault(url, threading.Lock())
+
+        with url_lock:
+            return ApiTools._call_with_etag_cache(url, cache_dir, default_max_age)
+
+
+    @staticmethod
+    def _call_with_etag_cache(
+            url             : str,
+            cache_dir       : str,
+            default_max_age : int,
+        ) -> tuple[dict, float]:
+        """
+        Implements call_with_etag_cache. Callers must hold the URL's lock.
+
+        Args:
+            url (str): The URL to call
+            cache_dir (str): The directory to cache responses in
+            default_max_age (int): How long to reuse a response if it doesn't set a max-age
+
+        Returns:
+            tuple: The JSON response from the API, and the time it stops being fresh
+        """
+
+        url_hash        = hashlib.sha256(url.encode()).hexdigest()
+        cache_filename  = os.path.join(cache_dir, f'{url_hash}.json')
+        cached          = None
+
+        if os.path.exists(cache_filename):
+            with open(cache_filename, 'rb') as cache_file:
+                cached = orjson.loads(cache_file.read())
+
+            if cached.get('expires', 0) > time.time():
+                print('Using cached API response.', file=sys.stderr)
+                return cached['response'], cached['expires']
+
+        cached_etag         = cached.get('etag') if cached else None
+        payload, headers    = ApiTools.call_if_modified(url, cached_etag)
+        max_age             = _get_max_age(headers, default_max_age)
+        expires             = time.time() + max_age
+
+        # A 304 may omit the ETag, which is then still the cached one. A new response's ETag, if
+        # any, is only its own.
+        if payload is None:
+            print('Using revalidated API response.', file=sys.stderr)
+            payload = cached['response']
+            etag    = headers.get('ETag', cached_etag)
+        else:
+            etag    = headers.get('ETag')
+
+        if _is_no_store(headers):
+            # Must not be kept, so drop any earlier cache entry too
+            if cached:
+                os.remove(cache_filename)
+
+        elif etag or max_age:
+            # Write to a temporary file and rename, so readers never see a partial cache entry
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as cache_file:
+                cache_file.write(orjson.dumps({
+                    'etag'      : etag,
+                    'expires'   : expires,
+                    'response'  : payload,
+                }))
+
+            os.replace(cache_file.name, cache_filename)
+
+        return payload, expires
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def call_with_retries(
-            self,
             url: str,
         ) -> dict:
         """
-        Utility function for calling an API with retries.
+        Utility function for calling an API with retries. Responses are memoized by URL for the
+        life of the process, so callers must not modify them.
 
         Args:
             url (str): The URL to call
@@ -29,27 +294,29 @@ class ApiTools:
             dict: The JSON response from the API
         """
 
-        session = requests.Session()
-        retry = Retry(
-            total               = API_MAX_RETRIES,
-            backoff_factor      = API_BACKOFF_FACTOR,
-            status_forcelist    = [
-                429,  # Too Many Requests
-                500,  # Internal Server Error
-                502,  # Bad Gateway
-                503,  # Service Unavailable
-                504,  # Gateway Timeout
-            ]
-        )
+        return orjson.loads(ApiTools._get(url).content)
+
+
+    @staticmethod
+    def _get(
+            url     : str,
+            headers : dict[str, str] = None,
+        ) -> requests.Response:
+        """
+        Sends a GET request with retries, exiting on failure.
+
+        Args:
+            url (str): The URL to call
+            headers (dict): Extra request headers
 
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
+        Returns:
+            requests.Response: The response from the API
+        """
 
         try:
-            response = session.get(url, timeout=5)
+            response = _get_session().get(url, headers=headers, timeout=5)
             response.raise_for_status()
-            return response.json()
+            return response
 
         except RequestException as e:
             print(f'Error: {e}', file=sys.stderr)
@@ -0,0 +1,523 @@
+"""
+Command line interface for getting a weather forecast, and optionally sending it to Discord with
+audio.
+"""
+
+import re
+import sys
+import argparse
+import datetime
+import operator
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+# requests, openai, and the src API modules are imported where they are used, so --help and usage
+# errors exit before paying for their import
+
+# Other Configuration
+WEBHOOK_NAME            = 'Barthur'
+TTS_VOICE               = 'onyx'
+TTS_SPEED               = 1.0
+TTS_CHUNK_SIZE          = 1000  # Characters of audio script per TTS request
+TTS_MAX_CONCURRENCY     = 4
+FORECAST_SCRIPT_SYSTEM_PROMPT = (
+    "You will be provided with a weather forecast. Summarize the weather report, "
+    "conversationally, in the voice of a grumpy old man doing his very best to play a weatherman. "
+    "His grammar isn't that great, and he clears his throat nervously sometimes. You can condense "
+    "each day's forecast; it does not have to be read out in full detail. Conclude your report "
+    f"with 'And this was {WEBHOOK_NAME}, with the weather.' Throw in a lot of wordplay and "
+    "colloquialisms. Do not include any scripted actions, as this will be used to create an audio "
+    "recording. Say state names instead of their abbreviations, e.g. 'Texas' instead of 'TX'. "
+    "Convert the '°' symbol to the word 'degrees', and F and C abbreviations to the words "
+    "'fahrenheit' and 'celsius'."
+)
+FORECAST_SCRIPT_SYSTEM_MESSAGE = {
+    'role':     'system',
+    'content':  FORECAST_SCRIPT_SYSTEM_PROMPT,
+}
+
+# The forecast period fields that are displayed
+PERIOD_FIELDS = operator.itemgetter('name', 'temperature', 'shortForecast', 'detailedForecast')
+
+# Weather icons, keyed by the short forecast keyword they represent. Keywords are ordered from most
+# to least significant, and the most significant keyword in a short forecast picks the icon.
+WEATHER_ICONS = {
+    't-storm':  '⛈️',
+    'thunder':  '⛈️',
+    'snow':     '❄️',
+    'rain':     '🌧️',
+    'drizzle':  '🌧️',
+    'fog':      '🌫️',
+    'cloudy':   '☁️',
+    'sunny':    '☀️',
+    'clear':    '🌙',
+}
+WEATHER_ICON_PRIORITY = { keyword: i for i, keyword in enumerate(WEATHER_ICONS) }
+WEATHER_ICON_PATTERN = re.compile(
+    '|'.join(re.escape(keyword) for keyword in WEATHER_ICONS),
+    re.IGNORECASE,
+)
+
+
+def construct_compact_forecast_text(
+        nws_payloads    : list['NwsWeatherForecast'],
+        limit           : int,
+    ) -> str:
+    """
+    Builds a compact, plain text version of the forecasts for the audio script prompt. There is one
+    line per period with only the temperature and short forecast. The detailed forecasts mostly
+    repeat the short forecast, so leaving them out cuts the prompt's input tokens by more than half.
+
+    Args:
+        nws_payloads (list): The forecasts to format
+        limit (int): The number of periods to include
+
+    Returns:
+        str: The compact forecast text
+    """
+
+    output = []
+    for nws_payload in nws_payloads:
+        periods = nws_payload.response['properties']['periods']
+
+        output.append(f'Weather forecast for {nws_payload.city}, {nws_payload.state}:\n')
+        for name, temperature, short_forecast, _ in map(PERIOD_FIELDS, periods[:limit]):
+            output.append(f'{name}: {temperature}°F, {short_forecast}\n')
+
+    return ''.join(output)
+
+
+def construct_forecast_text(
+        nws_payload     : 'NwsWeatherForecast',
+        limit           : int,
+        use_markdown    : bool,
+    ) -> str:
+    """
+    Builds the forecast text for a single zip code.
+
+    Args:
+        nws_payload (NwsWeatherForecast): The forecast to format
+        limit (int): The number of periods to display
+        use_markdown (bool): Whether to output in markdown format
+
+    Returns:
+        str: The formatted forecast text
+    """
+
+    city            = nws_payload.city
+    state           = nws_payload.state
+    radar_station   = nws_payload.radar_station
+    header2         = '## ' if use_markdown else ''
+    bold            = '**' if use_markdown else ''
+    blockquote      = '>' if use_markdown else ' '
+
+    # Flatten each period to the fields that are displayed, in one C-level call per period
+    periods         = nws_payload.response['properties']['periods']
+    rows            = map(PERIOD_FIELDS, periods[:limit])
+
+    output = [f'{header2}Weather forecast for {city}, {state} ({radar_station}):\n\n']
+    for name, temperature, short_forecast, detailed_forecast in rows:
+        weather_icon    = get_weather_icon(short_forecast)
+
+        output.append(
+            f"{bold}{name}:{bold}\n"
+            f"{blockquote} {weather_icon} {temperature}°F {short_forecast}\n"
+            f"{blockquote} {detailed_forecast}\n\n"
+        )
+
+    return ''.join(output)
+
+
+def construct_output(
+        nws_payloads    : list['NwsWeatherForecast'],
+        limit           : int,
+        use_markdown    : bool,
+    ) -> str:
+    """
+    Builds the forecast text output.
+
+    Args:
+        nws_payloads (list): The forecasts to format
+        limit (int): The number of periods to display
+        use_markdown (bool): Whether to output in markdown format
+
+    Returns:
+        str: The formatted forecast text
+    """
+
+    return '\n'.join(
+        construct_forecast_text(nws_payload, limit, use_markdown)
+        for nws_payload in nws_payloads
+    )
+
+
+def generate_audio_file(
+        forecast_audio_script   : str,
+        openai_api_key          : str,
+    ) -> tuple[str, bytes]:
+    """
+    Generates the audio file for the forecast. The audio is kept in memory rather than written to
+    disk, as it is only needed for the Discord upload.
+
+    The script is split into chunks of whole sentences, which are synthesized concurrently and
+    joined in order. MP3 frames are self-contained, so the joined audio plays as one file.
+
+    Args:
+        forecast_audio_script (str): The audio script to use for the forecast
+        openai_api_key (str): The OpenAI API key
+
+    Returns:
+        tuple: The filename and content of the audio file
+    """
+
+    from openai import OpenAIError  # Deferred, see get_openai_client()
+
+    client  = get_openai_client(openai_api_key)
+    chunks  = split_audio_script(forecast_audio_script)
+
+    def synthesize(chunk: str) -> bytes:
+        # Stream the body so audio is collected as it arrives, without the SDK buffering a copy
+        with client.audio.speech.with_streaming_response.create(
+                input           = chunk,
+                model           = 'tts-1-hd',
+                response_format = 'mp3',
+                speed           = TTS_SPEED,
+                voice           = TTS_VOICE,
+            ) as response:
+            return b''.join(response.iter_bytes(chunk_size=64 * 1024))
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), TTS_MAX_CONCURRENCY)) as executor:
+            audio_content = b''.join(executor.map(synthesize, chunks))
+
+    except OpenAIError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    today           = datetime.date.today().isoformat()
+    audio_filename  = f'{today} Weather Forecast.mp3'
+
+    return audio_filename, audio_content
+
+
+def generate_audio_script(
+        forecast_text   : str,
+        openai_api_key  : str,
+    ) -> str:
+    """
+    Generates the text script for the forecast audio.
+    
+    Args:
+        forecast_text (str): The forecast text to convert to audio, ideally the compact version
+        openai_api_key (str): The OpenAI API key
+
+    Returns:
+        str: The audio script to use for the forecast
+    """
+
+    from openai import OpenAIError  # Deferred, see get_openai_client()
+
+    # Summarize forecast_text using gpt-3.5-turbo model
+    try:
+        client      = get_openai_client(openai_api_key)
+        response    = client.chat.completions.create(
+            model   = 'gpt-3.5-turbo',
+            messages=[
+                FORECAST_SCRIPT_SYSTEM_MESSAGE,
+                {
+                    'role':     'user',
+                    'content':  forecast_text,
+                },
+            ]
+        )
+
+    except OpenAIError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    audio_script = response.choices[0].message.content
+
+    # DEBUG - looking for why odd units "ferras" are spoken
+    print(f'audio script: {audio_script}', file=sys.stderr)
+
+    return audio_script
+
+def get_command_line_args() -> dict[str, int, bool, str, str]:
+    """
+    Get the command line arguments.
+    
+    Returns:
+        dict: The command line arguments
+    """
+
+    parser = argparse.ArgumentParser(description='Get the weather forecast for a given zip code')
+
+    parser.add_argument(
+        'zip_code',
+        type    = str,
+        help    = (
+            'The zip code to get the weather forecast for (supports multiple, comma-separated zip '
+            'codes)'
+        ),
+    )
+
+    parser.add_argument(
+        '--limit', '-l',
+        type    = int,
+        default = 14,
+        help    = (
+            'The number of periods to display (1-20). There are two periods per day. Default '
+            'value is 14.'
+        ),
+    )
+
+    parser.add_argument(
+        '--markdown', '-m',
+        action  = 'store_true',
+        help    = 'Output in markdown format',
+    )
+
+    parser.add_argument(
+        '--openai-api-key', '-o',
+        type    = str,
+        help    = 'The OpenAI API key',
+    )
+
+    # A comma-separated list of webhook URLs
+    parser.add_argument(
+        '--discord-webhook-urls', '-d',
+        type    = str,
+        help    = 'The Discord webhook URL (supports multiple, comma-separated URLs)',
+    )
+
+    args = parser.parse_args()
+
+    # Handle invalid arguments
+    if args.limit < 1 or args.limit > 20:
+        print('Error: Limit must be a value between 1-20.', file=sys.stderr)
+        sys.exit(1)
+
+    if bool(args.openai_api_key) and not bool(args.discord_webhook_urls):
+        print('Error: OpenAI API key requires a Discord webhook URL.', file=sys.stderr)
+        sys.exit(1)
+
+    # Split comma-separated zip codes, ignoring whitespace and empty entries, and drop duplicates
+    # while keeping their order
+    zip_codes = [zip_code.strip() for zip_code in args.zip_code.split(',') if zip_code.strip()]
+
+    if not zip_codes:
+        print('Error: At least one zip code is required.', file=sys.stderr)
+        sys.exit(1)
+
+    return {
+        'zip_codes'             : list(dict.fromkeys(zip_codes)),
+        'limit'                 : args.limit,
+        'use_markdown'          : args.markdown,
+        'openai_api_key'        : args.openai_api_key,
+        'discord_webhook_urls'  :
+            args.discord_webhook_urls.split(',') if args.discord_webhook_urls else [],
+    }
+
+
+def get_forecasts(zip_codes: list[str]) -> list['NwsWeatherForecast']:
+    """
+    Gets the forecasts for the given zip codes. Forecasts for multiple zip codes are fetched
+    concurrently.
+
+    Args:
+        zip_codes (list): The zip codes to get the forecast for
+
+    Returns:
+        list: The forecasts, in the same order as the zip codes
+    """
+
+    from src.nws_weather_forecast import NwsWeatherForecast
+
+    print(f'Getting forecast for {", ".join(zip_codes)}... ', file=sys.stderr)
+    return NwsWeatherForecast.fetch_many(zip_codes)
+
+
+@functools.lru_cache(maxsize=1)
+def get_openai_client(openai_api_key: str) -> 'OpenAI':
+    """
+    Gets the OpenAI client. The client is created once and shared by the audio script and audio
+    file requests, so both reuse the same connection pool.
+
+    The openai package takes several hundred milliseconds to import, so it is only imported when an
+    OpenAI API key is provided.
+
+    The client retries rate limits, timeouts, and server errors itself, with jittered exponential
+    backoff that honors Retry-After. It uses the same retry budget as the other API calls.
+
+    Args:
+        openai_api_key (str): The OpenAI API key
+
+    Returns:
+        OpenAI: The OpenAI client
+    """
+
+    from openai import OpenAI
+    from src.api_tools import API_MAX_RETRIES
+
+    return OpenAI(api_key=openai_api_key, max_retries=API_MAX_RETRIES)
+
+
+@functools.lru_cache(maxsize=64)
+def get_weather_icon(short_forecast: str) -> str:
+    """
+    Gets the weather icon for a given short forecast. The icon is chosen by the most significant
+    keyword in the short forecast, e.g. 'Sunny then Chance T-storms' gets the thunderstorm icon.
+    NWS uses a small vocabulary of short forecasts, so results are memoized.
+
+    Args:
+        short_forecast (str): The short forecast to get the icon for
+
+    Returns:
+        str: The weather icon
+    """
+
+    # Find every keyword in one pass, then pick the most significant
+    keywords = WEATHER_ICON_PATTERN.findall(short_forecast)
+    if keywords:
+        keyword = min((keyword.lower() for keyword in keywords), key=WEATHER_ICON_PRIORITY.get)
+        return WEATHER_ICONS[keyword]
+
+    return '❓'
+
+
+def output_forecast(
+        forecast_text           : str,
+        compact_forecast_text   : str,
+        openai_api_key          : str,
+        discord_webhook_urls    : list[str],
+    ) -> None:
+    """
+    Output the forecast to the console or send to Discord
+
+    Args:
+        forecast_text (str): The forecast text to output
+        compact_forecast_text (str): The compact forecast text to generate the audio script from
+        openai_api_key (str): The OpenAI API key
+        discord_webhook_urls (list): The Discord webhook URLs
+    """
+
+    if not discord_webhook_urls:
+        # Output to console only
+        print(forecast_text)
+        return
+
+    plural_webhooks             = 's' if len(discord_webhook_urls) > 1 else ''
+    data_payload                = { 'content': forecast_text }
+    audio_payload               = None
+
+    # Attach audio if an OpenAI API key is provided
+    if openai_api_key:
+        print('Generating audio script... ', file=sys.stderr)
+        forecast_audio_script   = generate_audio_script(compact_forecast_text, openai_api_key)
+        print(f'Audio script: {forecast_audio_script}', file=sys.stderr)
+
+        print('Generating audio file... ', file=sys.stderr)
+        audio_filename, audio_content = generate_audio_file(
+            forecast_audio_script,
+            openai_api_key,
+        )
+        audio_payload           = { 'file': (audio_filename, audio_content, 'audio/mp3') }
+
+    print(f'Sending to Discord webhook{plural_webhooks}... ', file=sys.stderr)
+    send_to_discord_webhooks(discord_webhook_urls, data_payload, audio_payload)
+
+
+def send_to_discord_webhooks(
+        discord_webhook_urls    : list[str],
+        data_payload            : dict,
+        files_payload           : dict = None,
+    ) -> None:
+    """
+    Sends the forecast to all Discord webhooks concurrently. Each webhook runs in its own worker
+    thread, so total wall time is that of the slowest webhook rather than the sum of all of them.
+    The posts share one session, with a connection pool sized to the number of webhooks.
+
+    Args:
+        discord_webhook_urls (list): The Discord webhook URLs
+        data_payload (dict): The form data to send
+        files_payload (dict): The files to attach, if any
+    """
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_maxsize=len(discord_webhook_urls))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def post(discord_webhook_url: str) -> 'requests.Response':
+            return session.post(
+                discord_webhook_url,
+                data            = data_payload,
+                files           = files_payload,
+                timeout         = 5,
+            )
+
+        with ThreadPoolExecutor(max_workers=len(discord_webhook_urls)) as executor:
+            for discord_response in executor.map(post, discord_webhook_urls):
+                print(f'Discord response: {discord_response}', file=sys.stderr)
+
+
+def split_audio_script(forecast_audio_script: str) -> list[str]:
+    """
+    Splits the audio script into chunks of whole sentences, each up to TTS_CHUNK_SIZE characters
+    where possible, so the chunks can be synthesized concurrently.
+
+    Args:
+        forecast_audio_script (str): The audio script to split
+
+    Returns:
+        list: The audio script chunks
+    """
+
+    chunks  = []
+    chunk   = ''
+
+    for sentence in re.split(r'(?<=[.!?])\s+', forecast_audio_script.strip()):
+        if chunk and len(chunk) + len(sentence) + 1 > TTS_CHUNK_SIZE:
+            chunks.append(chunk)
+            chunk = sentence
+        else:
+            chunk = f'{chunk} {sentence}' if chunk else sentence
+
+    chunks.append(chunk)
+
+    return chunks
+
+
+def main() -> None:
+    """Main function."""
+
+    try:
+        options = get_command_line_args()
+
+        nws_payloads = get_forecasts(options['zip_codes'])
+
+        forecast_text = construct_output(
+            nws_payloads,
+            options['limit'],
+            options['use_markdown'],
+        )
+
+        compact_forecast_text = construct_compact_forecast_text(
+            nws_payloads,
+            options['limit'],
+        )
+
+        output_forecast(
+            forecast_text,
+            compact_forecast_text,
+            options['openai_api_key'],
+            options['discord_webhook_urls'],
+        )
+
+    except KeyboardInterrupt:
+        print('Error: Script execution cancelled.', file=sys.stderr)
+        sys.exit(1)
@@ -2,28 +2,85 @@
 Get a weather forecast for a given zip code.
 """
 
-import os
 import sys
-from src.api_tools import ApiTools
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.api_tools import API_MAX_CONNECTIONS, ApiTools
+
+# ZIP code coordinates and NWS /points lookups are cached in a SQLite database
+CACHE_DB_FILENAME = '.cache.db'
+
+# NWS forecast responses are cached in a directory, one JSON file per forecast URL
+FORECAST_CACHE_DIR = '.forecast_cache'
+
+# NWS grid point assignments rarely change, so cached /points lookups are used without asking the
+# API for 7 days. After that they are revalidated with a conditional request.
+NWS_POINTS_CACHE_TTL = 7 * 24 * 60 * 60
+
+# NWS forecasts update about hourly, so a forecast is reused until its Cache-Control max-age
+# passes. This is how long it is reused if NWS doesn't send a max-age.
+FORECAST_MEMO_TTL = 10 * 60
+
+# The cache database connection, opened on first use, and the locations and forecasts fetched in
+# this process, keyed by zip code with the time they stop being fresh. Forecasts for multiple zip
+# codes may be fetched from worker threads, so access is guarded by a lock.
+_CACHE_DB: sqlite3.Connection = None
+_LOCATION_MEMO: dict[str, tuple[float, dict[str, str]]] = {}
+_FORECAST_MEMO: dict[str, tuple[float, dict]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _get_cache_db() -> sqlite3.Connection:
+    """
+    Gets the cache database connection, opening it and creating its tables on first use. One
+    connection is kept per process. Callers must hold _CACHE_LOCK.
+
+    Returns:
+        sqlite3.Connection: The cache database connection
+    """
+
+    global _CACHE_DB
+
+    if _CACHE_DB is None:
+        _CACHE_DB = sqlite3.connect(CACHE_DB_FILENAME, check_same_thread=False)
+
+        # Write-ahead logging lets concurrent runs of the script read while another one writes
+        _CACHE_DB.execute('PRAGMA journal_mode=WAL')
+
+        with _CACHE_DB:
+            _CACHE_DB.execute(
+                'CREATE TABLE IF NOT EXISTS coords(zip TEXT PRIMARY KEY, lat REAL, lng REAL)'
+            )
+            _CACHE_DB.execute(
+                'CREATE TABLE IF NOT EXISTS points('
+                'point TEXT PRIMARY KEY, city TEXT, state TEXT, radar_station TEXT, '
+                'forecast_url TEXT, etag TEXT, expires REAL)'
+            )
+
+    return _CACHE_DB
+
 
 class NwsWeatherForecast:
     """
-    Get a weather forecast for a given zip code.
+    Get a weather forecast for a given zip code. Nothing is fetched until an attribute is first
+    read, and the location lookups are shared, so reading only the city or state never fetches the
+    forecast.
 
     Args:
         zip_code (str): The zip code to get the weather forecast for
 
     Attributes:
         zip_code (str): The zip code to get the weather forecast for
-        forecast (dict): The weather forecast
         city (str): The city for the weather forecast
         state (str): The state for the weather forecast
         radar_station (str): The radar station for the weather forecast
-
-    Returns:
-        dict: The weather forecast
+        response (dict): The NWS forecast response
     """
 
+    __slots__ = ('zip_code', '_location', '_response', '_lock')
+
     def __init__(self,
             zip_code: str,
         ):
@@ -31,27 +88,145 @@ class NwsWeatherForecast:
         Initializes the NwsWeatherForecast class.
         """
 
-        self.zip_code       = zip_code
-        self.forecast       = self._get_forecast_from_weather_api()
-        self.city           = self.forecast['location']['city']
-        self.state          = self.forecast['location']['state']
-        self.radar_station  = self.forecast['location']['radar_station']
+        self.zip_code   = zip_code
+        self._location  = None
+        self._response  = None
+
+        # Guards the lazily fetched attributes, so concurrent first reads fetch them only once
+        self._lock      = threading.RLock()
+
+
+    @property
+    def city(self) -> str:
+        """
+        The city for the weather forecast.
+        """
+
+        return self._get_location()['city']
+
+
+    @classmethod
+    def fetch_many(
+            cls,
+            zip_codes   : list[str],
+            max_workers : int = API_MAX_CONNECTIONS,
+        ) -> list['NwsWeatherForecast']:
+        """
+        Fetches the forecasts for multiple zip codes concurrently, so wall time is that of the
+        slowest zip code rather than the sum of all of them. The default concurrency is the API
+        connection pool size, so every worker reuses a pooled connection.
+
+        Args:
+            zip_codes (list): The zip codes to get the forecasts for
+            max_workers (int): The maximum number of concurrent fetches
+
+        Returns:
+            list: The forecasts, in the same order as the zip codes
+        """
+
+        if not zip_codes:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(len(zip_codes), max_workers)) as executor:
+            return list(executor.map(lambda zip_code: cls(zip_code).fetch(), zip_codes))
+
+
+    def fetch(self) -> 'NwsWeatherForecast':
+        """
+        Fetches the location and forecast now, rather than on first access, e.g. from a worker
+        thread.
+
+        Returns:
+            NwsWeatherForecast: This forecast
+        """
+
+        _ = self.city, self.state, self.radar_station, self.response
+        return self
+
+
+    @property
+    def radar_station(self) -> str:
+        """
+        The radar station for the weather forecast.
+        """
+
+        return self._get_location()['radar_station']
+
+
+    @property
+    def response(self) -> dict:
+        """
+        The NWS forecast response.
+        """
+
+        with self._lock:
+            if self._response is None:
+                self._response = self._get_forecast_from_weather_api()
+
+        return self._response
+
+
+    @property
+    def state(self) -> str:
+        """
+        The state for the weather forecast.
+        """
+
+        return self._get_location()['state']
+
 
     def _cache_coordinates(
             self,
-            coordinates         : dict[float, float],
-            zip_cache_filename  : str,
+            coordinates: dict[float, float],
         ) -> None:
         """
         Caches coordinates for a given zip code.
 
         Args:
             coordinates (dict): The coordinates to cache
-            zip_cache_filename (str): The filename of the zip code cache
         """
 
-        with open(zip_cache_filename, 'a', encoding='utf-8') as zip_cache:
-            zip_cache.write(f'{self.zip_code},{coordinates["lat"]},{coordinates["lng"]}\n')
+        with _CACHE_LOCK:
+            cache_db = _get_cache_db()
+            with cache_db:
+                cache_db.execute(
+                    'INSERT OR REPLACE INTO coords(zip, lat, lng) VALUES (?, ?, ?)',
+                    (self.zip_code, float(coordinates['lat']), float(coordinates['lng'])),
+                )
+
+
+    def _cache_nws_location_info(
+            self,
+            points_key  : str,
+            location    : dict[str, str],
+            etag        : str,
+            expires     : float,
+        ) -> None:
+        """
+        Caches the NWS location data for a given point.
+
+        Args:
+            points_key (str): The "lat,lng" key of the point
+            location (dict): The location data to cache
+            etag (str): The ETag of the NWS /points response
+            expires (float): The time the cached location stops being fresh
+        """
+
+        with _CACHE_LOCK:
+            cache_db = _get_cache_db()
+            with cache_db:
+                cache_db.execute(
+                    'INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        points_key,
+                        location['city'],
+                        location['state'],
+                        location['radar_station'],
+                        location['forecast_url'],
+                        etag,
+                        expires,
+                    ),
+                )
 
 
     def _get_coordinates(self) -> dict[float, float]:
@@ -62,47 +237,41 @@ class NwsWeatherForecast:
             dict: The coordinates for the given zip code
         """
 
-        zip_cache_filename = '.zip_cache'
-
         # Check local cache
-        coordinates = self._get_coordinates_from_cache(zip_cache_filename)
+        coordinates = self._get_coordinates_from_cache()
         if coordinates:
             return coordinates
 
         else:
             coordinates = self._get_coordinates_from_geo_api()
-            self._cache_coordinates(coordinates, zip_cache_filename)
+            self._cache_coordinates(coordinates)
             return coordinates
 
 
-    def _get_coordinates_from_cache(
-            self,
-            zip_cache_filename: str,
-        ) -> dict[float, float]:
+    def _get_coordinates_from_cache(self) -> dict[float, float]:
         """
         Gets the ZIP code coordinates from the cache.
-        
-        Args:
-            zip_cache_filename (str): The filename of the zip code cache
 
         Returns:
             dict: The coordinates for the given zip code
         """
 
-        if os.path.exists(zip_cache_filename):
-            with open(zip_cache_filename, 'r', encoding='utf-8') as zip_cache:
-                for line in zip_cache:
-                    if self.zip_code in line:
-                        print('Using cached coordinates.', file=sys.stderr)
-                        coordinates = line.split(',')
-
-                        return {
-                            'lat': float(coordinates[1]),
-                            'lng': float(coordinates[2]),
-                        }
+        with _CACHE_LOCK:
+            row = _get_cache_db().execute(
+                'SELECT lat, lng FROM coords WHERE zip = ?',
+                (self.zip_code,),
+            ).fetchone()
 
         # Coordinates not cached
-        return None
+        if row is None:
+            return None
+
+        print('Using cached coordinates.', file=sys.stderr)
+
+        return {
+            'lat': row[0],
+            'lng': row[1],
+        }
 
 
     def _get_coordinates_from_geo_api(
@@ -120,7 +289,7 @@ class NwsWeatherForecast:
 
         print('Getting coordinates from geo API.', file=sys.stderr)
         geo_api         = f'https://api.zippopotam.us/us/{self.zip_code}'
-        geo_response    = ApiTools.call_with_retries(self, geo_api)
+        geo_response    = ApiTools.call_with_retries(geo_api)
 
         coordinates = {
             'lat'       : geo_response['places'][0]['latitude'],
@@ -130,37 +299,131 @@ class NwsWeatherForecast:
         return coordinates
 
 
-    def _get_forecast_from_weather_api(self) -> dict[str, dict]:
+    def _get_forecast_from_weather_api(self) -> dict:
         """
-        Gets the weather forecast for a given location from the NWS API.
+        Gets the weather forecast for a given location from the NWS API. Repeat lookups of the same
+        zip code reuse the earlier result without any I/O until it stops being fresh, as given by
+        its Cache-Control max-age or FORECAST_MEMO_TTL.
+
+        Returns:
+            dict: The NWS forecast response
+        """
+
+        with _CACHE_LOCK:
+            memo = _FORECAST_MEMO.get(self.zip_code)
+
+        if memo and memo[0] > time.time():
+            return memo[1]
+
+        # Get forecast from NWS API
+        nws_forecast_api        = self._get_location()['forecast_url']
+        nws_forecast_response, expires = ApiTools.call_with_etag_cache(
+            nws_forecast_api,
+            FORECAST_CACHE_DIR,
+            FORECAST_MEMO_TTL,
+        )
+
+        with _CACHE_LOCK:
+            _FORECAST_MEMO[self.zip_code] = (expires, nws_forecast_response)
+
+        return nws_forecast_response
+
+
+    def _get_location(self) -> dict[str, str]:
+        """
+        Gets the NWS location data for the zip code, fetching it on first use. Repeat lookups of
+        the same zip code reuse the earlier result without any I/O until it stops being fresh.
+
+        Returns:
+            dict: The location data
+        """
+
+        with self._lock:
+            if self._location is None:
+                with _CACHE_LOCK:
+                    memo = _LOCATION_MEMO.get(self.zip_code)
+
+                if memo and memo[0] > time.time():
+                    self._location = memo[1]
+
+                else:
+                    location, expires = self._get_nws_location(self._get_coordinates())
+
+                    with _CACHE_LOCK:
+                        _LOCATION_MEMO[self.zip_code] = (expires, location)
+
+                    self._location = location
+
+        return self._location
+
+
+    def _get_nws_location(
+            self,
+            coordinates: dict[float, float],
+        ) -> tuple[dict[str, str], float]:
+        """
+        Gets the NWS location data for the given coordinates from the cache or NWS API.
+
+        Args:
+            coordinates (dict): The coordinates to get the location data for
+
+        Returns:
+            tuple: The location data, and the time it stops being fresh
         """
 
-        # Get coordinates from geo API
-        coordinates             = self._get_coordinates()
         lat                     = coordinates['lat']
         lng                     = coordinates['lng']
+        points_key              = f'{float(lat)},{float(lng)}'
 
-        # Get location from NWS API
+        # Check local cache
+        with _CACHE_LOCK:
+            row = _get_cache_db().execute(
+                'SELECT city, state, radar_station, forecast_url, etag, expires FROM points '
+                'WHERE point = ?',
+                (points_key,),
+            ).fetchone()
+
+        cached_location = {
+            'city'              : row[0],
+            'state'             : row[1],
+            'radar_station'     : row[2],
+            'forecast_url'      : row[3],
+        } if row else None
+
+        if row and row[5] > time.time():
+            print('Using cached NWS location.', file=sys.stderr)
+            return cached_location, row[5]
+
+        # Missing or stale, so fetch it. A stale entry is revalidated with its ETag, and reused if
+        # NWS reports it unchanged.
         nws_location_api        = f'https://api.weather.gov/points/{lat},{lng}'
-        nws_location_response   = ApiTools.call_with_retries(self, nws_location_api)
-        location                = self._get_nws_location_info(nws_location_response)
+        cached_etag             = row[4] if row else None
+        nws_location_response, headers = ApiTools.call_if_modified(
+            nws_location_api,
+            cached_etag,
+        )
+
+        # A 304 may omit the ETag, which is then still the cached one
+        if nws_location_response is None:
+            print('Using revalidated NWS location.', file=sys.stderr)
+            location            = cached_location
+            etag                = headers.get('ETag', cached_etag)
+        else:
+            location            = self._get_nws_location_info(nws_location_response)
+            etag                = headers.get('ETag')
 
-        # Get forecast from NWS API
-        nws_forecast_api        = nws_location_response['properties']['forecast']
-        nws_forecast_response   = ApiTools.call_with_retries(self, nws_forecast_api)
+        expires                 = time.time() + NWS_POINTS_CACHE_TTL
+        self._cache_nws_location_info(points_key, location, etag, expires)
 
-        return {
-            'location': location,
-            'response': nws_forecast_response,
-        }
+        return location, expires
 
 
     def _get_nws_location_info(
             self,
             nws_location_response: dict,
-        ) -> dict[str, str, str]:
+        ) -> dict[str, str]:
         """
-        Gets the city, state, and radar_station for a provided NWS response.
+        Gets the city, state, radar_station, and forecast URL for a provided NWS response.
         
         Args:
             nws_location_response (dict): The response from the NWS API
@@ -173,9 +436,12 @@ class NwsWeatherForecast:
         city                    = location_data['properties']['city']
         state                   = location_data['properties']['state']
         radar_station           = nws_location_response['properties']['radarStation']
+        forecast_url            = nws_location_response['properties']['forecast']
 
         return {
             'city'              : city,
             'state'             : state,
             'radar_station'     : radar_station,
+            'forecast_url'      : forecast_url,
         }
+